@@ -0,0 +1,62 @@
+"""
+Numba kernels for the numerical hot paths.
+
+This module requires numba. Callers import it inside a try/except and fall
+back to the NumPy implementations when it is not available.
+"""
+import numpy as np
+from numba import njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def displace_batch(N, alphas, log_fact, out):
+    """
+    Fills out[k] with the (N, N) displacement matrix D(alphas[k]).
+
+    Each diagonal m - n = d is swept in n with the Laguerre recurrence
+    L_{n+1}^{(d)} = ((2n + 1 + d - x) L_n^{(d)} - (n + d) L_{n-1}^{(d)})/(n + 1)
+    and the upper triangle is filled from D_{nm} = (-1)^d conj(D_{mn}).
+
+    Args:
+        N (int): Hilbert space dimension (cutoff)
+        alphas (np.ndarray): 1D complex array of K displacements
+        log_fact (np.ndarray): log(n!) for n = 0, ..., N - 1
+        out (np.ndarray): complex array of shape (K, N, N) to write into
+    """
+    for k in prange(alphas.shape[0]):
+        alpha = alphas[k]
+        x = alpha.real**2 + alpha.imag**2
+        alpha_d = 1. + 0j
+        for d in range(N):
+            sign = 1. - 2.*(d % 2)
+            L_prev = 0.
+            L = 1.
+            for n in range(N - d):
+                if n > 0:
+                    L_next = ((2*n - 1 + d - x)*L - (n - 1 + d)*L_prev)/n
+                    L_prev = L
+                    L = L_next
+                value = (np.exp(0.5*(log_fact[n] - log_fact[n + d]) - 0.5*x)
+                         * L * alpha_d)
+                out[k, n + d, n] = value
+                if d > 0:
+                    out[k, n, n + d] = sign*np.conj(value)
+            alpha_d *= alpha
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def coherent_batch(N, alphas, out):
+    """
+    Fills out[k] with the Fock amplitudes of the coherent state |alphas[k]>
+    using c[n + 1] = c[n] * alpha / sqrt(n + 1) and c[0] = exp(-|alpha|^2/2).
+
+    Args:
+        N (int): Hilbert space dimension (cutoff)
+        alphas (np.ndarray): 1D complex array of K amplitudes
+        out (np.ndarray): complex array of shape (K, N) to write into
+    """
+    for k in prange(alphas.shape[0]):
+        alpha = alphas[k]
+        out[k, 0] = np.exp(-0.5*(alpha.real**2 + alpha.imag**2))
+        for n in range(N - 1):
+            out[k, n + 1] = out[k, n]*alpha/np.sqrt(n + 1)
@@ -1,33 +1,287 @@
 """Functions and operations used throughout"""
+from functools import lru_cache
+
+import warnings
+
 import numpy as np
-from qutip import displace
+from scipy.linalg import expm
+from scipy.special import eval_genlaguerre
+from qutip import Qobj
 from qutip.random_objects import rand_dm
 
+try:
+    from qst_cgan import _kernels
+except ImportError:
+    _kernels = None
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+# Enables sanity checks, such as the trace of mixed states, in the hot paths
+DEBUG = False
+
+
+def _rand_dm_dense(N, rng=None):
+    """
+    Samples a dense random density matrix X X^dag / tr(X X^dag) where X has
+    i.i.d. complex Gaussian entries.
+
+    Args:
+    ----
+        N (int): Hilbert space dimension
+        rng (`np.random.Generator`, optional): random number generator, the
+                                               global NumPy state by default
 
-def add_state_noise(dm, sigma=0.01, sparsity=0.01):
+    Returns:
+    -------
+        rho (`np.ndarray`): (N, N) density matrix
     """
+    if rng is None:
+        rng = np.random
+    X = rng.standard_normal((N, N)) + 1j*rng.standard_normal((N, N))
+    rho = X @ X.conj().T
+    return rho/np.trace(rho).real
+
+
+def add_state_noise(dm, sigma=0.01, sparsity=0.01, sparse=None, rng=None):
+    r"""
     Adds a random density matrices to the input state.
     
     .. math::
         \rho_{mixed} = \sigma \rho_0 + (1 - \sigma)\rho_{rand}$
 
+    The random density matrix is sampled densely unless it is expected to
+    have fewer than N non-zero elements, i.e., sparsity*N**2 < N, in which
+    case `qutip.rand_dm` is used.
+
     Args:
     ----
         dm (`qutip.Qobj`): Density matrix of the input pure state
         sigma (float): the mixing parameter specifying the pure state probability
         sparsity (float): the sparsity of the random density matrix
+        sparse (None or bool): force the sparse (True) or dense (False) sampling
+        rng (`np.random.Generator`, optional): random number generator for the
+                                               dense sampling
     
     Returns:
     -------
         rho (`qutip.Qobj`): the mixed state density matrix
     """
     hilbertsize = dm.shape[0]
-    rho  = (1 - sigma)*dm + sigma*(rand_dm(hilbertsize, sparsity))
-    rho = rho/rho.tr()
+    if sparse is None:
+        sparse = sparsity*hilbertsize**2 < hilbertsize
+
+    # Both terms have unit trace so the mixture needs no renormalization
+    if sparse:
+        rho  = (1 - sigma)*dm + sigma*(rand_dm(hilbertsize, sparsity))
+    else:
+        rho = (1 - sigma)*dm.full() + sigma*_rand_dm_dense(hilbertsize, rng)
+        rho = Qobj(rho, dims=dm.dims)
+    if DEBUG:
+        assert abs(rho.tr() - 1) < 1e-10
     return rho
 
 
-def measure(alpha, rho=None):
+def _as_array(rho):
+    """Returns the dense matrix of a `qutip.Qobj`, or the array itself"""
+    return rho.full() if hasattr(rho, "full") else np.asarray(rho)
+
+
+def _cast_rho(rho, dtype):
+    """
+    Casts density matrices to `dtype`. When this lowers the precision, warns
+    if rho is not Hermitian with unit trace to within the target precision.
+    """
+    dtype = np.dtype(dtype)
+    if (np.issubdtype(rho.dtype, np.inexact)
+            and np.finfo(dtype).eps > np.finfo(rho.dtype).eps):
+        tol = np.finfo(dtype).eps*rho.shape[-1]
+        trace = np.trace(rho, axis1=-2, axis2=-1)
+        rho_dag = np.conj(np.swapaxes(rho, -1, -2))
+        hermitian = np.allclose(rho, rho_dag, rtol=0, atol=tol)
+        if not hermitian or np.any(np.abs(trace - 1) > tol):
+            warnings.warn("rho is not a Hermitian unit-trace matrix to {} "
+                          "precision".format(dtype.name))
+    return rho.astype(dtype, copy=False)
+
+
+@lru_cache(maxsize=16)
+def _laguerre_setup(N):
+    """
+    Precomputes the alpha-independent parts of the analytic displacement for
+    a Hilbert space of dimension N.
+
+    Args:
+    ----
+        N (int): Hilbert space dimension (cutoff)
+
+    Returns:
+    -------
+        log_fact (`np.ndarray`): log(n!) for n = 0, ..., N - 1
+        m, n (`np.ndarray`): row and column indices of the lower triangle
+        k (`np.ndarray`): the Laguerre orders m - n
+        fact_ratio (`np.ndarray`): sqrt(n!/m!) on the lower triangle
+        sign (`np.ndarray`): (-1)**k used to mirror the upper triangle
+    """
+    log_fact = np.concatenate(([0.], np.cumsum(np.log(np.arange(1, N)))))
+    m, n = np.tril_indices(N)
+    k = m - n
+    fact_ratio = np.exp((log_fact[n] - log_fact[m])/2)
+    sign = (-1.)**k
+    setup = (log_fact, m, n, k, fact_ratio, sign)
+    for arr in setup:
+        arr.flags.writeable = False
+    return setup
+
+
+def _displace_analytical(N, alpha, dtype=np.complex128):
+    r"""
+    Builds the displacement operator D(alpha) in a truncated Fock basis from
+    the closed-form matrix elements
+
+    .. math::
+        D_{mn} = \sqrt{n!/m!} \alpha^{m-n} e^{-|\alpha|^2/2} L_n^{(m-n)}(|\alpha|^2)
+
+    for m >= n, and :math:`D_{nm} = (-1)^{m-n} D_{mn}^*` above the diagonal.
+    This avoids the matrix exponential used by `qutip.displace`. The Numba
+    kernel is used when numba is installed.
+
+    Args:
+    ----
+        N (int): Hilbert space dimension (cutoff)
+        alpha (complex or array_like): the displacement(s)
+        dtype (`np.dtype`): complex dtype of the result, the matrix elements
+                            are always evaluated in double precision
+
+    Returns:
+    -------
+        D (`np.ndarray`): the displacement matrices of shape
+                          `np.shape(alpha) + (N, N)`
+    """
+    log_fact, m, n, k, fact_ratio, sign = _laguerre_setup(N)
+    if _kernels is not None:
+        alpha = np.asarray(alpha, dtype=np.complex128)
+        D = np.empty(alpha.shape + (N, N), dtype=dtype)
+        _kernels.displace_batch(N, alpha.reshape(-1), log_fact,
+                                D.reshape(-1, N, N))
+        return D
+
+    alpha = np.asarray(alpha)[..., None]
+    x = np.abs(alpha)**2
+
+    lower = (fact_ratio * np.exp(-x/2)
+             * eval_genlaguerre(n, k, x) * np.power(alpha, k))
+
+    D = np.zeros(alpha.shape[:-1] + (N, N), dtype=np.complex128)
+    D[..., m, n] = lower
+    D[..., n, m] = sign * np.conj(lower)
+    return D.astype(dtype, copy=False)
+
+
+@lru_cache(maxsize=16)
+def _annihilation_dense(N):
+    """Returns the annihilation operator as a dense read-only (N, N) array"""
+    a = np.diag(np.sqrt(np.arange(1, N)), k=1).astype(np.complex128)
+    a.flags.writeable = False
+    return a
+
+
+def _displace_expm(N, alpha, dtype=np.complex128):
+    """
+    Builds the displacement operator D(alpha) = exp(alpha a^dag - alpha^* a)
+    with a dense Pade matrix exponential of the truncated generator, which
+    is what `qutip.displace` computes.
+
+    Args:
+    ----
+        N (int): Hilbert space dimension (cutoff)
+        alpha (complex or array_like): the displacement(s)
+        dtype (`np.dtype`): complex dtype of the result
+
+    Returns:
+    -------
+        D (`np.ndarray`): the displacement matrices of shape
+                          `np.shape(alpha) + (N, N)`
+    """
+    alpha = np.asarray(alpha, dtype=np.complex128)
+    a = _annihilation_dense(N)
+    adag = a.T
+    D = np.empty(alpha.shape + (N, N), dtype=dtype)
+    for idx, alpha_k in np.ndenumerate(alpha):
+        D[idx] = expm(alpha_k*adag - np.conj(alpha_k)*a)
+    return D
+
+
+def _displace(N, alpha, dtype=np.complex128, method="analytic"):
+    """
+    Builds displacement operators with the given method, either "analytic"
+    (`_displace_analytical`) or "expm" (`_displace_expm`).
+    """
+    if method == "analytic":
+        return _displace_analytical(N, alpha, dtype=dtype)
+    elif method == "expm":
+        return _displace_expm(N, alpha, dtype=dtype)
+    raise ValueError("Unknown displacement method {}".format(method))
+
+
+@lru_cache(maxsize=8)
+def _displacement_stack(N, xvec_bytes, yvec_bytes, dtype, method):
+    """
+    Builds the (K, N, N) stack of displacements D(-beta) for the flattened
+    grid beta = (x + 1j*p)/sqrt(2). The grids are passed as the bytes of
+    float64 arrays so that repeated calls with the same grid hit the cache.
+
+    Args:
+    ----
+        N (int): Hilbert space dimension (cutoff)
+        xvec_bytes (bytes): the x grid as `xvec.tobytes()`
+        yvec_bytes (bytes): the p grid as `yvec.tobytes()`
+        dtype (`np.dtype`): complex dtype of the stack
+        method (str): the displacement method, "analytic" or "expm"
+
+    Returns:
+    -------
+        D (`np.ndarray`): read-only array of shape (len(yvec)*len(xvec), N, N)
+    """
+    D = _build_displacement_stack(N, xvec_bytes, yvec_bytes, dtype, method)
+    D.flags.writeable = False
+    return D
+
+
+def _build_displacement_stack(N, xvec_bytes, yvec_bytes, dtype, method):
+    """Uncached builder behind `_displacement_stack`"""
+    xvec = np.frombuffer(xvec_bytes, dtype=np.float64)
+    yvec = np.frombuffer(yvec_bytes, dtype=np.float64)
+    betas = ((xvec[None, :] + 1j*yvec[:, None])/np.sqrt(2)).reshape(-1)
+    return _displace(N, -betas, dtype=dtype, method=method)
+
+
+@lru_cache(maxsize=8)
+def _displacement_stack_torch(N, xvec_bytes, yvec_bytes, dtype, method,
+                              device):
+    """
+    Returns the displacement stack of `_displacement_stack` as a flattened
+    (K*N, N) `torch.Tensor` kept on `device`. The host stack is built
+    without going through the NumPy cache, so only the device copy is kept.
+    """
+    D = _build_displacement_stack(N, xvec_bytes, yvec_bytes, dtype, method)
+    return torch.tensor(D.reshape(-1, N), device=device)
+
+
+def clear_displacement_cache():
+    """
+    Frees the displacement stacks cached by `generalized_q_batch`, both the
+    NumPy ones and the ones kept on PyTorch devices.
+    """
+    _displacement_stack.cache_clear()
+    _displacement_stack_torch.cache_clear()
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def measure(alpha, rho=None, dtype=np.complex128, method="analytic"):
     """
     Measures the photon number statistics for state rho when displaced
     by angle alpha.
@@ -36,23 +290,135 @@ def measure(alpha, rho=None):
     ----------    
     alpha: np.complex
         A complex displacement.
+    rho: `qutip.Qobj` or ndarray
+        The density matrix.
+    dtype: np.dtype
+        The complex dtype used for the computation, e.g., np.complex64.
+    method: str
+        "analytic" for the closed-form displacement or "expm" for the dense
+        matrix exponential of the truncated generator.
     Returns
     -------
     population: ndarray
-        A 1D array for the probabilities for populations.
-    """
-    hilbertsize = rho.shape[0]
-    D = displace(hilbertsize, -alpha)
-    rho_disp = D*rho*D.dag()
-    populations = np.real(np.diagonal(rho_disp.full()))
-    return np.array(populations).reshape(-1)
-
-
-def generalized_q(rho, xvec, yvec):
-    hilbertsize = rho.shape[0]
-    q = np.zeros(shape = (len(xvec), len(yvec), hilbertsize))
-    for i, p in enumerate(yvec):
-        for j, x in enumerate(xvec):
-            beta = (x + 1j*p)/np.sqrt(2)
-            q[i, j] = measure(beta, rho)
-    return q
+        A 1D array of the Fock level populations of the displaced state.
+
+    The analytic displacement holds the exact matrix elements of D cut to
+    N x N, which is not unitary on the truncated space. When the displaced
+    state reaches the cutoff the populations therefore sum to less than one.
+    Use method="expm" if populations that sum to one are needed.
+    """
+    rho_full = _cast_rho(_as_array(rho), dtype)
+    hilbertsize = rho_full.shape[0]
+    D = _displace(hilbertsize, -alpha, dtype=dtype, method=method)
+    # Only the diagonal of D rho D^dag is needed
+    M = D @ rho_full
+    populations = (np.einsum("mj,mj->m", M.real, D.real)
+                   + np.einsum("mj,mj->m", M.imag, D.imag))
+    return populations
+
+
+def generalized_q(rho, xvec, yvec, dtype=np.complex128, method="analytic"):
+    """
+    Computes the generalized Q function, i.e., the photon number statistics
+    of rho displaced to every point beta = (x + 1j*p)/sqrt(2) of the grid.
+    As in `measure`, the analytic displacement is not unitary on the
+    truncated space; use method="expm" for populations that sum to one.
+
+    Args:
+    ----
+        rho (`qutip.Qobj` or ndarray): Density matrix of the state
+        xvec (array_like): the x grid
+        yvec (array_like): the p grid
+        dtype (`np.dtype`): the complex dtype used for the computation
+        method (str): the displacement method, "analytic" or "expm"
+
+    Returns:
+    -------
+        q (`np.ndarray`): array of shape (len(yvec), len(xvec), N)
+    """
+    return generalized_q_batch(_as_array(rho)[None], xvec, yvec, dtype=dtype,
+                               method=method)[0]
+
+
+def generalized_q_batch(rhos, xvec, yvec, dtype=np.complex128,
+                        method="analytic", device=None, to_numpy=True):
+    """
+    Computes the generalized Q function for a batch of density matrices
+    sharing the same grid.
+
+    All displacements are built at once as a (K, N, N) stack, which is cached
+    for repeated calls on the same grid, and only the diagonals of
+    D rho D^dag are evaluated. The batch is laid side by side as an
+    (N, B*N) matrix so that D rho for every grid point and every rho is a
+    single (K*N, N) x (N, B*N) GEMM. The product is a complex intermediate of
+    B*K*N^2 elements, so for large batches or grids pass rhos in chunks.
+
+    If a `device` is given the contraction runs in PyTorch, with the
+    displacement stack cached on that device. `device="auto"` selects CUDA
+    when it is available and NumPy otherwise. Up to eight stacks of K*N^2
+    complex elements are retained per backend, which can hold a lot of GPU
+    memory for fine grids; call `clear_displacement_cache` to free them.
+
+    Args:
+    ----
+        rhos (ndarray, `torch.Tensor` or list of `qutip.Qobj`): Density
+                                                matrices of shape (B, N, N)
+        xvec (array_like): the x grid
+        yvec (array_like): the p grid
+        dtype (`np.dtype`): the complex dtype used for the computation, e.g.,
+                            np.complex64 to halve the memory traffic
+        method (str): the displacement method, "analytic" or "expm"
+        device (None, str or `torch.device`): the PyTorch device to use, or
+                                              None for NumPy
+        to_numpy (bool): whether to copy the PyTorch result back to an ndarray
+
+    Returns:
+    -------
+        q (`np.ndarray` or `torch.Tensor`): array of shape
+                                            (B, len(yvec), len(xvec), N)
+    """
+    xvec = np.asarray(xvec, dtype=np.float64)
+    yvec = np.asarray(yvec, dtype=np.float64)
+    dtype = np.dtype(dtype)
+
+    if device == "auto":
+        cuda = torch is not None and torch.cuda.is_available()
+        device = "cuda" if cuda else None
+    if device is not None:
+        if torch is None:
+            raise ImportError("PyTorch is required to use a device")
+        return _generalized_q_torch(rhos, xvec, yvec, dtype, method, device,
+                                    to_numpy)
+
+    if not isinstance(rhos, np.ndarray):
+        rhos = np.stack([_as_array(rho) for rho in rhos])
+    rhos = _cast_rho(rhos, dtype)
+    batchsize, hilbertsize = rhos.shape[:2]
+    D = _displacement_stack(hilbertsize, xvec.tobytes(), yvec.tobytes(), dtype,
+                            method)
+    D = D.reshape(-1, hilbertsize)
+    rhos = rhos.transpose(1, 0, 2).reshape(hilbertsize, -1)
+    M = (D @ rhos).reshape(-1, batchsize, hilbertsize)
+    # Re(sum_j M_mj conj(D_mj)) without forming the conjugate of the stack
+    q = (np.einsum("mbj,mj->bm", M.real, D.real)
+         + np.einsum("mbj,mj->bm", M.imag, D.imag))
+    return q.reshape(batchsize, len(yvec), len(xvec), hilbertsize)
+
+
+def _generalized_q_torch(rhos, xvec, yvec, dtype, method, device, to_numpy):
+    """PyTorch implementation of `generalized_q_batch`"""
+    if not torch.is_tensor(rhos):
+        if not isinstance(rhos, np.ndarray):
+            rhos = np.stack([_as_array(rho) for rho in rhos])
+        rhos = _cast_rho(rhos, dtype)
+    device = torch.device(device)
+    batchsize, hilbertsize = rhos.shape[:2]
+    D = _displacement_stack_torch(hilbertsize, xvec.tobytes(), yvec.tobytes(),
+                                  dtype, method, device)
+    rhos = torch.as_tensor(rhos, dtype=D.dtype, device=device)
+    rhos = rhos.transpose(0, 1).reshape(hilbertsize, -1)
+    M = (D @ rhos).reshape(-1, batchsize, hilbertsize)
+    q = (torch.einsum("mbj,mj->bm", M.real, D.real)
+         + torch.einsum("mbj,mj->bm", M.imag, D.imag))
+    q = q.reshape(batchsize, len(yvec), len(xvec), hilbertsize)
+    return q.cpu().numpy() if to_numpy else q
@@ -0,0 +1,200 @@
+"""
+Tests for the operations used throughout
+"""
+import pytest
+
+import numpy as np
+
+from qutip import displace, coherent
+
+from qst_cgan import ops
+from qst_cgan.ops import (_displace_analytical, add_state_noise, measure,
+                          generalized_q, generalized_q_batch)
+
+
+@pytest.mark.parametrize("alpha", [0, 0.5 + 0.3j, -1.2j, 2.0])
+def test_displace_analytical(alpha):
+    """Analytic displacement matches QuTiP away from the truncation edge"""
+    hilbert_size = 60
+    D = _displace_analytical(hilbert_size, alpha)
+    D_qutip = displace(hilbert_size, alpha).full()
+    assert np.allclose(D[:20, :20], D_qutip[:20, :20], atol=1e-10)
+
+
+def test_measure_coherent():
+    """Displacing a coherent state back to vacuum gives the vacuum population"""
+    rho = coherent(32, 1.0 + 0.5j).proj()
+    populations = measure(1.0 + 0.5j, rho)
+    assert np.isclose(populations[0], 1.0)
+    assert np.allclose(populations[1:], 0.0, atol=1e-10)
+
+
+def test_generalized_q():
+    """The vectorized Q function matches pointwise measurements"""
+    rho = coherent(16, 0.5).proj()
+    xvec = np.linspace(-2, 2, 5)
+    yvec = np.linspace(-1, 1, 3)
+    q = generalized_q(rho, xvec, yvec)
+    assert q.shape == (len(yvec), len(xvec), 16)
+    for i, p in enumerate(yvec):
+        for j, x in enumerate(xvec):
+            beta = (x + 1j*p)/np.sqrt(2)
+            assert np.allclose(q[i, j], measure(beta, rho))
+
+
+def test_displace_analytical_numpy_fallback(monkeypatch):
+    """The Numba kernel and the NumPy fallback agree"""
+    alphas = np.array([[0, 0.5 + 0.3j], [-1.2j, 2.0]])
+    D = _displace_analytical(40, alphas)
+    monkeypatch.setattr(ops, "_kernels", None)
+    assert np.allclose(D, _displace_analytical(40, alphas), atol=1e-10)
+
+
+def test_generalized_q_cached_stack():
+    """Repeated calls on the same grid reuse the displacement stack"""
+    xvec = np.linspace(-2, 2, 4)
+    yvec = np.linspace(-1, 1, 4)
+    q1 = generalized_q(coherent(16, 0.5).proj(), xvec, yvec)
+    hits = ops._displacement_stack.cache_info().hits
+    q2 = generalized_q(coherent(16, -0.5j).proj(), xvec.copy(), yvec.copy())
+    assert ops._displacement_stack.cache_info().hits == hits + 1
+    assert not np.allclose(q1, q2)
+
+
+def test_measure_ndarray():
+    """measure accepts a density matrix as a Qobj or an ndarray"""
+    rho = coherent(16, 0.3 - 0.7j).proj()
+    assert np.allclose(measure(0.4j, rho), measure(0.4j, rho.full()))
+
+
+def test_generalized_q_ndarray():
+    """generalized_q accepts a density matrix as a Qobj or an ndarray"""
+    rho = coherent(16, 0.3 - 0.7j).proj()
+    xvec = np.linspace(-1, 1, 3)
+    assert np.allclose(generalized_q(rho, xvec, xvec),
+                       generalized_q(rho.full(), xvec, xvec))
+
+
+def test_generalized_q_batch():
+    """The batched Q function matches single-state evaluations"""
+    rhos = [coherent(16, 0.5).proj(), coherent(16, -0.2 + 0.4j).proj()]
+    xvec = np.linspace(-2, 2, 5)
+    yvec = np.linspace(-1, 1, 3)
+    q = generalized_q_batch(rhos, xvec, yvec)
+    assert q.shape == (2, len(yvec), len(xvec), 16)
+    for rho, q_rho in zip(rhos, q):
+        assert np.allclose(q_rho, generalized_q(rho, xvec, yvec))
+    rhos_full = np.stack([rho.full() for rho in rhos])
+    assert np.allclose(q, generalized_q_batch(rhos_full, xvec, yvec))
+
+
+def test_generalized_q_batch_torch():
+    """The PyTorch backend matches the NumPy implementation"""
+    torch = pytest.importorskip("torch")
+    rhos = [coherent(16, 0.5).proj(), coherent(16, -0.2 + 0.4j).proj()]
+    xvec = np.linspace(-2, 2, 5)
+    yvec = np.linspace(-1, 1, 3)
+    q = generalized_q_batch(rhos, xvec, yvec)
+    q_torch = generalized_q_batch(rhos, xvec, yvec, device="cpu", to_numpy=False)
+    assert torch.is_tensor(q_torch)
+    assert np.allclose(q_torch.numpy(), q)
+    rhos_torch = torch.as_tensor(np.stack([rho.full() for rho in rhos]))
+    assert np.allclose(generalized_q_batch(rhos_torch, xvec, yvec, device="cpu"), q)
+
+
+def test_clear_displacement_cache():
+    """The device stack bypasses the host cache and both can be freed"""
+    pytest.importorskip("torch")
+    ops.clear_displacement_cache()
+    xvec = np.linspace(-1, 1, 4)
+    generalized_q_batch([coherent(8, 0.3).proj()], xvec, xvec, device="cpu")
+    assert ops._displacement_stack.cache_info().currsize == 0
+    assert ops._displacement_stack_torch.cache_info().currsize == 1
+    generalized_q_batch([coherent(8, 0.3).proj()], xvec, xvec)
+    ops.clear_displacement_cache()
+    assert ops._displacement_stack.cache_info().currsize == 0
+    assert ops._displacement_stack_torch.cache_info().currsize == 0
+
+
+def test_generalized_q_complex64():
+    """Single precision gives float32 populations close to double precision"""
+    rho = coherent(16, 0.5 + 0.5j).proj()
+    xvec = np.linspace(-2, 2, 5)
+    q = generalized_q(rho, xvec, xvec)
+    q64 = generalized_q(rho, xvec, xvec, dtype=np.complex64)
+    assert q64.dtype == np.float32
+    assert np.allclose(q64, q, atol=1e-5)
+    assert measure(0.3, rho, dtype=np.complex64).dtype == np.float32
+
+
+def test_generalized_q_complex64_warns():
+    """Downcasting an unnormalized rho warns about the loss of precision"""
+    rho = 2*coherent(16, 0.5).proj()
+    xvec = np.linspace(-1, 1, 3)
+    with pytest.warns(UserWarning):
+        generalized_q(rho, xvec, xvec, dtype=np.complex64)
+
+
+@pytest.mark.parametrize("sparse", [None, True, False])
+def test_add_state_noise(monkeypatch, sparse):
+    """Mixing with a random density matrix keeps unit trace"""
+    monkeypatch.setattr(ops, "DEBUG", True)
+    dm = coherent(16, 0.5).proj()
+    rho = add_state_noise(dm, sigma=0.2, sparsity=0.5, sparse=sparse)
+    assert np.isclose(rho.tr(), 1.0)
+    assert rho.isherm
+    assert rho.dims == dm.dims
+
+
+def test_rand_dm_dense():
+    """Dense random density matrices are positive with unit trace"""
+    rho = ops._rand_dm_dense(8, np.random.default_rng(42))
+    assert np.isclose(np.trace(rho), 1.0)
+    assert np.allclose(rho, rho.conj().T)
+    assert np.all(np.linalg.eigvalsh(rho) > -1e-12)
+
+
+def test_displace_expm():
+    """The dense matrix exponential reproduces qutip.displace"""
+    alphas = np.array([0.5 + 0.3j, -1.2j])
+    D = ops._displace_expm(16, alphas)
+    for alpha, D_alpha in zip(alphas, D):
+        assert np.allclose(D_alpha, displace(16, alpha).full())
+
+
+def test_generalized_q_expm():
+    """Both displacement methods agree away from the truncation edge"""
+    rho = coherent(32, 0.5).proj()
+    xvec = np.linspace(-1, 1, 3)
+    q = generalized_q(rho, xvec, xvec)
+    q_expm = generalized_q(rho, xvec, xvec, method="expm")
+    assert np.allclose(q[..., :10], q_expm[..., :10], atol=1e-8)
+    with pytest.raises(ValueError):
+        measure(0.1, rho, method="unknown")
+
+
+def test_displace_analytical_truncation():
+    """The analytic displacement is the exact operator cut to N x N"""
+    D = _displace_analytical(32, 3.0)
+    assert np.allclose(D, displace(96, 3.0).full()[:32, :32], atol=1e-12)
+
+
+def test_measure_truncation():
+    """Displacing past the cutoff loses population with the analytic
+    method, while the truncated matrix exponential conserves it"""
+    rho = coherent(32, 2.0).proj() + coherent(32, -2.0).proj()
+    rho = rho / rho.tr()
+    assert measure(3.0, rho).sum() < 0.99
+    assert np.isclose(measure(3.0, rho, method="expm").sum(), 1.0)
+
+
+def test_integer_density_matrix():
+    """Integer density matrices are cast without a precision check"""
+    rho = np.diag([1, 0, 0, 0])
+    xvec = np.linspace(-1, 1, 3)
+    assert np.allclose(measure(0.5, rho), measure(0.5, rho.astype(float)))
+    assert np.allclose(generalized_q(rho, xvec, xvec),
+                       generalized_q(rho.astype(float), xvec, xvec))
+    q = generalized_q_batch(np.stack([rho, rho]), xvec, xvec,
+                            dtype=np.complex64)
+    assert np.allclose(q[1], generalized_q(rho, xvec, xvec), atol=1e-5)
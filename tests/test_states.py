@@ -7,10 +7,121 @@ import numpy as np
 
 from qutip import Qobj, coherent, fock
 
-from qst_cgan.states import cat, num, binomial, gkp
+from qst_cgan import states
+from qst_cgan.states import cat, num, binomial, gkp, _coherent_matrix
 
 
-import pytest
+@pytest.mark.parametrize("alpha", [0, 1.5, -0.3 + 2j])
+def test_coherent_matrix(alpha):
+    """The recursive coherent state matches the analytic QuTiP state"""
+    expected = coherent(32, alpha, method="analytic").full().ravel()
+    assert np.allclose(_coherent_matrix(32, [alpha])[0], expected)
+
+
+def test_cat():
+    """A two-component cat state is the normalized sum of coherent states"""
+    alpha = 1.2 + 0.4j
+    expected = (coherent(32, -alpha, method="analytic")
+                + coherent(32, alpha, method="analytic")).unit()
+    ket = cat(32, alpha)
+    assert ket.isket
+    assert np.allclose(ket.full(), expected.full())
+
+
+def test_cat_near_cutoff():
+    """Large cat states use the exact coherent amplitudes, not the truncated
+    displacement of the vacuum"""
+    alpha = 4.5
+    phases = [1, 1j, -1, -1j]
+    expected = sum(s * coherent(32, -p * alpha, method="analytic")
+                   for s, p in zip([1, 1, 1, 1], phases))
+    ket = cat(32, alpha, S=1)
+    assert np.allclose(ket.full(), expected.unit().full())
+
+
+def test_gkp():
+    """GKP states are normalized kets"""
+    ket = gkp(32, 0.3)
+    assert ket.isket
+    assert np.isclose(ket.norm(), 1.0)
+
+
+@pytest.mark.parametrize("mu", [0, 1])
+def test_gkp_lattice_sum(mu):
+    """gkp matches the explicit weighted lattice sum of coherent states"""
+    delta, zrange = 0.3, 3
+    c = np.sqrt(np.pi / 2)
+    expected = 0 * coherent(32, 0, method="analytic")
+    for n1 in range(-zrange, zrange):
+        for n2 in range(-zrange, zrange):
+            a = c * (2 * n1 + mu + 1j * n2)
+            weight = (np.exp(-(delta ** 2) * np.abs(a) ** 2)
+                      * np.exp(-1j * c ** 2 * 2 * n1 * n2))
+            expected += weight * coherent(32, a, method="analytic")
+    ket = gkp(32, delta, mu=mu, zrange=zrange)
+    assert np.allclose(ket.full(), expected.unit().full(), atol=1e-10)
+
+
+def test_gkp_zrange():
+    """The lattice range passed to gkp is used"""
+    assert not np.allclose(gkp(32, 0.2, zrange=1).full(), gkp(32, 0.2).full())
+
+
+def test_coherent_matrix_numpy_fallback(monkeypatch):
+    """The Numba kernel and the NumPy fallback agree"""
+    alphas = [0, 1.5, -0.3 + 2j]
+    c = states._coherent_matrix(32, alphas)
+    monkeypatch.setattr(states, "_kernels", None)
+    assert np.allclose(c, states._coherent_matrix(32, alphas))
+
+
+def test_num():
+    """The number state uses the given amplitudes in the Fock basis"""
+    probs = [[1, 0, 0, 1], [0, 1, 1, 0]]
+    ket = num(8, probs=probs, mu=1)
+    expected = (fock(8, 1) + fock(8, 2)).unit()
+    assert ket.isket
+    assert np.allclose(ket.full(), expected.full())
+
+
+def test_binomial():
+    """The binomial state populates every (S + 1)-th Fock state"""
+    ket = binomial(16, 1, N=3, mu=1)
+    expected = (fock(16, 0) - 2 * fock(16, 2)
+                + np.sqrt(6) * fock(16, 4)).unit()
+    assert ket.isket
+    assert np.allclose(ket.full(), expected.full())
+
+
+@pytest.mark.parametrize("idx", range(5))
+def test_num_default_codes(idx):
+    """The tabulated number codes give normalized kets"""
+    probs = states._get_num_prob(idx)
+    ket = num(32, probs=probs, mu=1)
+    assert ket.isket
+    assert np.isclose(ket.norm(), 1.0)
+
+
+def test_num_default():
+    """num uses the first tabulated code when no probabilities are given"""
+    expected = num(32, probs=states._get_num_prob(0))
+    assert np.allclose(num(32).full(), expected.full())
+    with pytest.raises(ValueError):
+        num(16)
+
+
+def test_cat_four_component():
+    """A four-component cat state matches the explicit superposition"""
+    alpha = 1.5
+    phases = [1, 1j, -1, -1j]
+    expected = sum(s * coherent(32, p * alpha, method="analytic")
+                   for s, p in zip([1, -1, 1, -1], phases))
+    ket = cat(32, alpha, S=1, mu=1)
+    assert np.allclose(ket.full(), (-expected).unit().full())
 
 
-pass
\ No newline at end of file
+def test_num_codes_read_only():
+    """The shared number-code tables cannot be modified in place"""
+    probs = states._get_num_prob(0)
+    with pytest.raises(ValueError):
+        probs[0] *= 2